@@ -7,30 +7,34 @@
 # requirements.txt sugerido:
 # streamlit
 # wordcloud
-# matplotlib
 # filelock
 # openai
+# orjson
 
+import atexit
+import io
 import json
 import os
 import re
+import sys
 import time
+import threading
+import unicodedata
 import hmac
-import colorsys
-from collections import Counter
+import hashlib
+import importlib.util
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 import streamlit as st
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
 
+# numpy, wordcloud e openai são importados só onde são usados: sessões públicas antes da
+# revelação nunca pagam o custo de carregá-los.
 # OpenAI (SDK oficial) - somente admin
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 # =============================
 # CONFIG (PRECISA SER O PRIMEIRO st.*)
@@ -72,12 +76,14 @@ st.markdown(
 # =============================
 # Paths / Defaults
 # =============================
-DATA_PATH = Path("data_words.json")
+DATA_PATH = Path("data_words.json")        # pergunta + flags (reescrito só em ações do admin)
+ENTRIES_PATH = Path("data_words.jsonl")    # respostas, append-only (uma por linha)
 DEFAULT_QUESTION = (
     "Em 1 palavra (ou expressão curta), o que mais impacta a qualidade de uma decisão baseada em dados?"
 )
 
-STOPWORDS_PT = {
+# Em NFC, a mesma forma em que _tokenizar normaliza o texto ("é" composto, não "e" + acento).
+STOPWORDS_PT = frozenset(sys.intern(unicodedata.normalize("NFC", w)) for w in {
     "a","à","ao","aos","as","às","com","como","da","das","de","do","dos","e","é","em","entre","para","por","pra",
     "pro","pros","pras","no","nos","na","nas","num","numa","nuns","numas","o","os","um","uma","uns","umas",
     "ou","nem","mas","porque","pois","que","quem","qual","quais","quando","onde","quanto","quantos","quantas",
@@ -93,7 +99,9 @@ STOPWORDS_PT = {
     "sim","não","nao","ok","oks","blz","beleza","tipo","assim","kk","kkk","haha","rs","rss","mds",
     "resposta","respostas","pergunta","perguntas","participante","participantes","tema","assunto",
     "aula","curso","uc","disciplina"
-}
+})
+# Incremente ao editar STOPWORDS_PT ou a tokenização (_word_re, normalização): força a recontagem dos tokens já acumulados na sessão.
+STOPWORDS_VERSION = 3
 
 # =============================
 # Lock (recomendado)
@@ -104,20 +112,43 @@ try:
 except Exception:
     LOCK_AVAILABLE = False
 
+@st.cache_resource(show_spinner=False)
+def _lock():
+    # Uma instância por processo; thread_local=True isola o estado de cada thread de sessão.
+    return FileLock(str(DATA_PATH) + ".lock", thread_local=True)
+
 def with_lock(fn):
     if not LOCK_AVAILABLE:
         return fn()
-    lock = FileLock(str(DATA_PATH) + ".lock")
-    with lock:
+    with _lock():
         return fn()
 
 # =============================
-# Persistência (pergunta + respostas + controle de revelação)
+# JSON (orjson recomendado; cai para o json da stdlib)
+# =============================
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except Exception:
+    ORJSON_AVAILABLE = False
+
+def _json_loads(raw: bytes):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _json_dumps(obj) -> bytes:
+    # Compacto e UTF-8 sem escapes (equivale a ensure_ascii=False).
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# =============================
+# Persistência (pergunta + controle de revelação no JSON; respostas no JSONL)
 # =============================
 def _empty_data() -> Dict:
     return {
         "question": DEFAULT_QUESTION,
-        "entries": [],                 # {"text": "...", "ts": 123}
         "public_show_cloud": False,    # público só vê após revelar
         "created_at": time.time(),
         "updated_at": time.time(),
@@ -127,11 +158,9 @@ def _read_data() -> Dict:
     if not DATA_PATH.exists():
         return _empty_data()
     try:
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _json_loads(DATA_PATH.read_bytes())
 
         data.setdefault("question", DEFAULT_QUESTION)
-        data.setdefault("entries", [])
         data.setdefault("public_show_cloud", False)
 
         return data
@@ -140,31 +169,132 @@ def _read_data() -> Dict:
 
 def _write_data(data: Dict):
     data["updated_at"] = time.time()
-    with open(DATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Grava num temporário e troca atomicamente: leitores nunca veem um arquivo pela metade.
+    tmp = DATA_PATH.with_suffix(".json.tmp")
+    tmp.write_bytes(_json_dumps(data))
+    os.replace(tmp, DATA_PATH)
+
+def _iter_entries():
+    # Uma resposta por linha: {"text": "...", "ts": 123}. Linhas inválidas são ignoradas.
+    with open(ENTRIES_PATH, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # última linha ainda sendo escrita (leitura sem lock)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield _json_loads(line)
+            except ValueError:
+                continue
+
+def _migrate_legacy_entries():
+    # Versões antigas guardavam as respostas em data_words.json; move-as para o JSONL uma única vez.
+    if ENTRIES_PATH.exists():
+        return
+    data = _read_data()
+    legacy = data.pop("entries", None) or []
+    with open(ENTRIES_PATH, "wb") as f:
+        for e in legacy:
+            f.write(_json_dumps(e) + b"\n")
+    if legacy:
+        _write_data(data)
+
+def _append_entry_lines(entries: List[Dict]):
+    _migrate_legacy_entries()
+    with open(ENTRIES_PATH, "ab") as f:
+        f.write(b"".join(_json_dumps(e) + b"\n" for e in entries))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _read_entries_cached(mtime_ns: int, size: int) -> List[Dict]:
+    # (mtime, tamanho) só muda quando alguém escreve: reruns sem resposta nova não relêem o arquivo.
+    # Sem lock: o log só cresce por append e linhas incompletas são descartadas; se a leitura
+    # pegar uma escrita no meio, o (mtime, tamanho) seguinte difere e o log é relido.
+    return list(_iter_entries())
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _read_data_cached(mtime_ns: int, size: int) -> Dict:
+    # O arquivo é lido e parseado uma vez por versão (escritas alteram mtime/tamanho); cada acerto do
+    # cache devolve uma cópia própria (st.cache_data desserializa), não um dict compartilhado.
+    # Sem lock: _write_data troca o arquivo via os.replace, então o leitor vê a versão antiga ou a nova.
+    return _read_data()
 
 def load_data() -> Dict:
-    return with_lock(_read_data)
+    try:
+        stat = DATA_PATH.stat()
+    except FileNotFoundError:
+        return _empty_data()
+    return _read_data_cached(stat.st_mtime_ns, stat.st_size)
 
-def load_question() -> str:
-    q = load_data().get("question", DEFAULT_QUESTION)
+# Os acessores aceitam um dict já lido, para cada bloco da UI ler o arquivo uma única vez.
+def load_question(data: Optional[Dict] = None) -> str:
+    q = (data or load_data()).get("question", DEFAULT_QUESTION)
     return (q or DEFAULT_QUESTION).strip() or DEFAULT_QUESTION
 
-def load_entries() -> List[Dict]:
-    return load_data().get("entries", []) or []
+def entries_version() -> Tuple[int, int]:
+    # (mtime, tamanho) do log; (0, 0) enquanto ele não existe. Serve de chave para caches derivados.
+    try:
+        stat = ENTRIES_PATH.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_entries(version: Optional[Tuple[int, int]] = None) -> List[Dict]:
+    version = version or entries_version()
+    if version == (0, 0):
+        return load_data().get("entries", []) or []
+    return _read_entries_cached(*version)
+
+# Fila de escrita: envios simultâneos da turma viram um único append (um lock, uma escrita).
+FLUSH_INTERVAL_S = 0.5
+FLUSH_MAX_PENDING = 20
+
+class _WriteQueue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: List[Dict] = []
+        self.timer: Optional[threading.Timer] = None
+
+@st.cache_resource(show_spinner=False)
+def _write_queue() -> _WriteQueue:
+    # Uma fila por processo, compartilhada por todas as sessões.
+    q = _WriteQueue()
+    # Timers são daemon: no encerramento do servidor, grava o que ficou na fila.
+    atexit.register(_flush_queue, q)
+    return q
+
+def _flush_queue(q: _WriteQueue):
+    # Escreve sob q.lock para que lotes concorrentes cheguem ao arquivo na ordem de envio.
+    with q.lock:
+        if q.timer is not None:
+            q.timer.cancel()
+            q.timer = None
+        batch, q.pending = q.pending, []
+        if batch:
+            with_lock(lambda: _append_entry_lines(batch))
+
+def flush_entries():
+    _flush_queue(_write_queue())
 
 def append_entry(text: str):
-    def inner():
-        data = _read_data()
-        data["entries"].append({"text": text, "ts": time.time()})
-        _write_data(data)
-    return with_lock(inner)
+    q = _write_queue()
+    with q.lock:
+        q.pending.append({"text": text, "ts": time.time()})
+        if len(q.pending) < FLUSH_MAX_PENDING:
+            if q.timer is None:
+                q.timer = threading.Timer(FLUSH_INTERVAL_S, _flush_queue, args=(q,))
+                q.timer.daemon = True
+                q.timer.start()
+            return
+    _flush_queue(q)
 
 def clear_all_entries():
+    q = _write_queue()
+    with q.lock:
+        q.pending.clear()  # envios ainda na fila também são descartados
     def inner():
-        data = _read_data()
-        data["entries"] = []
-        _write_data(data)
+        _migrate_legacy_entries()
+        open(ENTRIES_PATH, "w").close()
     return with_lock(inner)
 
 def set_question(new_q: str):
@@ -174,8 +304,8 @@ def set_question(new_q: str):
         _write_data(data)
     return with_lock(inner)
 
-def load_public_show_cloud() -> bool:
-    return bool(load_data().get("public_show_cloud", False))
+def load_public_show_cloud(data: Optional[Dict] = None) -> bool:
+    return bool((data or load_data()).get("public_show_cloud", False))
 
 def set_public_show_cloud(show: bool):
     def inner():
@@ -187,83 +317,130 @@ def set_public_show_cloud(show: bool):
 # =============================
 # Tokenização
 # =============================
-_word_re = re.compile(r"[a-zà-ÿ]+", flags=re.IGNORECASE)
+# Tamanho mínimo (2) já no padrão; texto é minusculizado antes, então sem IGNORECASE.
+# Letras latinas minúsculas de Latin-1; a faixa pula o "÷" (U+00F7) que ficava dentro de à-ÿ.
+_word_re = re.compile(r"[a-zà-öø-ÿ]{2,}")
+
+def _tokenizar(texto: str) -> Tuple[str, ...]:
+    # Tokens internados: a mesma palavra repetida vira uma única string nas chaves do Counter.
+    stop, intern = STOPWORDS_PT, sys.intern  # locais: evita lookup global por token
+    # NFC antes do findall: "é" decomposto (e + U+0301) partiria a palavra no acento.
+    texto = unicodedata.normalize("NFC", (texto or "").lower())
+    return tuple([intern(tk) for tk in _word_re.findall(texto) if tk not in stop])
 
-def tokenizar(texto: str) -> List[str]:
-    texto = (texto or "").lower().strip()
-    texto = re.sub(r"\s+", " ", texto)
-    tokens = _word_re.findall(texto)
+@st.cache_resource(show_spinner=False)
+def _tokenizar_memo(stopwords_version: int):
+    # O script é reexecutado a cada rerun; o lru_cache fica num recurso do processo para sobreviver a isso.
+    return lru_cache(maxsize=4096)(_tokenizar)
 
-    out = []
-    for tk in tokens:
-        tk = tk.lower().strip()
-        if len(tk) < 2:
-            continue
-        if tk in STOPWORDS_PT:
-            continue
-        out.append(tk)
-    return out
+# Respostas repetidas ("qualidade", "governança"...) viram consulta ao cache.
+tokenizar = _tokenizar_memo(STOPWORDS_VERSION)
 
 # =============================
 # WordCloud (freq -> cor e tamanho)
 # =============================
-def gerar_wordcloud_fig(tokens: List[str]):
-    if not tokens:
-        return None
-
-    freqs = Counter(tokens)
+CLOUD_MAX_WORDS = 250  # só os N termos mais frequentes aparecem (e entram na chave do cache)
+CLOUD_SMALL_VOCAB = 40  # abaixo disso a nuvem é desenhada em meia resolução
+
+def _color_map(freqs: Dict[str, int]) -> Dict[str, str]:
+    # Mesmo resultado de colorsys.hsv_to_rgb por palavra, calculado de uma vez com NumPy.
+    import numpy as np
+
+    f = np.fromiter(freqs.values(), dtype=np.float64, count=len(freqs))
+    f /= f.max()
+    hue = 0.62 - 0.62 * f  # azul -> vermelho conforme frequência
+    sat = 0.92
+    val = 0.95
+
+    h6 = hue * 6.0
+    i = h6.astype(np.int64)
+    frac = h6 - i
+    i %= 6
+    v = np.full_like(hue, val)
+    p = np.full_like(hue, val * (1.0 - sat))
+    q = val * (1.0 - sat * frac)
+    t = val * (1.0 - sat * (1.0 - frac))
+
+    r = np.choose(i, [v, q, p, p, t, v])
+    g = np.choose(i, [t, v, v, q, p, p])
+    b = np.choose(i, [p, p, t, v, v, q])
+    rgb = (np.stack([r, g, b], axis=1) * 255).astype(np.int64)
+    return {w: f"rgb({r}, {g}, {b})" for w, (r, g, b) in zip(freqs, rgb.tolist())}
+
+def gerar_wordcloud_png(freqs: Dict[str, int]):
+    # Versão sem cache; na UI use build_cloud (cacheada por conteúdo).
     if not freqs:
         return None
 
-    max_f = max(freqs.values())
+    from wordcloud import WordCloud
+
+    color_map = _color_map(freqs)
 
     def color_func(word, font_size, position, orientation, random_state=None, **kwargs):
-        f = freqs.get(word, 1) / max_f
-        hue = 0.62 - 0.62 * f  # azul -> vermelho conforme frequência
-        sat = 0.92
-        val = 0.95
-        r, g, b = colorsys.hsv_to_rgb(hue, sat, val)
-        return f"rgb({int(r*255)}, {int(g*255)}, {int(b*255)})"
+        return color_map[word]
 
+    # Poucos termos: canvas menor (1/4 dos pixels) e fonte máxima na mesma proporção.
+    width = 900 if len(freqs) < CLOUD_SMALL_VOCAB else 1800
     wc = WordCloud(
-        width=1800,
-        height=900,
+        width=width,
+        height=width // 2,
         background_color="white",
         mode="RGB",
         prefer_horizontal=0.70,
         relative_scaling=1.0,
         min_font_size=10,
-        max_font_size=260,
-        max_words=250,
+        max_font_size=260 * width // 1800,
+        max_words=CLOUD_MAX_WORDS,
         collocations=False,
         random_state=42,
-        margin=2
+        margin=2,
+        color_func=color_func,
     ).generate_from_frequencies(freqs)
 
-    wc = wc.recolor(color_func=color_func, random_state=42)
+    # PNG pronto: o cache guarda poucos KB (não o array RGB inteiro) e o st.image não recodifica.
+    buf = io.BytesIO()
+    wc.to_image().save(buf, format="PNG")
+    return buf.getvalue()
 
-    fig, ax = plt.subplots(figsize=(16, 7), dpi=160)
-    ax.imshow(wc, interpolation="bilinear")
-    ax.axis("off")
-    return fig
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_cloud(freq_items: Tuple[Tuple[str, int], ...]) -> Optional[bytes]:
+    # Reruns sem respostas novas (mesmas frequências) devolvem a imagem do cache.
+    return gerar_wordcloud_png(dict(freq_items))
 
 # =============================
 # Admin auth
 # =============================
-ADMIN_USER = st.secrets.get("ADMIN_USER", os.getenv("ADMIN_USER", "admin"))
-ADMIN_PASS = st.secrets.get("ADMIN_PASS", os.getenv("ADMIN_PASS", ""))  # defina nos secrets
+@st.cache_resource(show_spinner=False)
+def _admin_creds() -> Tuple[str, str]:
+    # Resolvido uma vez por processo (st.secrets não é relido a cada rerun).
+    return (
+        st.secrets.get("ADMIN_USER", os.getenv("ADMIN_USER", "admin")),
+        st.secrets.get("ADMIN_PASS", os.getenv("ADMIN_PASS", "")),  # defina nos secrets
+    )
+
+def _digest(s: str) -> bytes:
+    return hashlib.sha256((s or "").encode("utf-8")).digest()
+
+ADMIN_USER, ADMIN_PASS = _admin_creds()
+# Compara digests de tamanho fixo (32 bytes), não as strings cruas de tamanho variável.
+ADMIN_USER_HASH, ADMIN_PASS_HASH = _digest(ADMIN_USER), _digest(ADMIN_PASS)
 
 def check_admin(user: str, pwd: str) -> bool:
-    return hmac.compare_digest(user or "", ADMIN_USER or "") and hmac.compare_digest(pwd or "", ADMIN_PASS or "")
+    return hmac.compare_digest(_digest(user), ADMIN_USER_HASH) and hmac.compare_digest(_digest(pwd), ADMIN_PASS_HASH)
 
 # =============================
 # Session state
 # =============================
 st.session_state.setdefault("is_admin", False)
+st.session_state.setdefault("admin_login_error", False)
 st.session_state.setdefault("input_answer", "")
 st.session_state.setdefault("admin_question_draft", "")
 st.session_state.setdefault("admin_api_key", "")
 st.session_state.setdefault("relatorio", "")
+st.session_state.setdefault("tok_counter", Counter())   # frequências acumuladas das respostas já lidas
+st.session_state.setdefault("tok_offset", 0)            # quantas linhas do log já foram contadas
+st.session_state.setdefault("tok_last", None)           # última entrada contada (detecta log zerado)
+st.session_state.setdefault("tok_version", STOPWORDS_VERSION)
 
 # =============================
 # Callback público
@@ -276,6 +453,24 @@ def on_answer_change():
         return
     append_entry(raw[:200])
 
+# =============================
+# Callbacks admin
+# =============================
+# Rodam antes do script: o rerun do próprio clique já mostra o estado novo, sem st.rerun() extra.
+def on_admin_login():
+    ss = st.session_state
+    ok = check_admin(ss.get("admin_user", ""), ss.get("admin_pass", ""))
+    ss.is_admin = ok
+    ss.admin_login_error = not ok
+
+def on_admin_logout():
+    st.session_state.is_admin = False
+
+def on_restore_question():
+    # O rascunho é chave de widget: só pode ser alterado antes de o text_area ser desenhado.
+    st.session_state.admin_question_draft = DEFAULT_QUESTION
+    set_question(DEFAULT_QUESTION)
+
 # =============================
 # Sidebar admin
 # =============================
@@ -287,43 +482,187 @@ with st.sidebar:
         st.session_state.is_admin = False
     else:
         if not st.session_state.is_admin:
-            u = st.text_input("Usuário", value="", placeholder="admin", key="admin_user")
-            p = st.text_input("Senha", value="", type="password", placeholder="••••••••", key="admin_pass")
-            if st.button("Entrar"):
-                if check_admin(u, p):
-                    st.session_state.is_admin = True
-                    st.success("Login admin ok.")
-                    st.rerun()
-                else:
-                    st.error("Usuário ou senha inválidos.")
+            st.text_input("Usuário", value="", placeholder="admin", key="admin_user")
+            st.text_input("Senha", value="", type="password", placeholder="••••••••", key="admin_pass")
+            st.button("Entrar", on_click=on_admin_login)
+            if st.session_state.admin_login_error:
+                st.error("Usuário ou senha inválidos.")
+                st.session_state.admin_login_error = False  # só no rerun do clique que falhou
         else:
             st.success("Admin autenticado.")
-            if st.button("Sair"):
-                st.session_state.is_admin = False
-                st.rerun()
+            st.button("Sair", on_click=on_admin_logout)
 
     st.divider()
     st.caption("Professor: defina a pergunta, acompanhe a coleta e revele a nuvem ao final.")
 
 # =============================
-# Dados
+# Dados (contagem incremental por sessão)
+# =============================
+def update_token_counter(entries: List[Dict]) -> Counter:
+    # Tokeniza só as respostas novas desde o último rerun; recomeça se o log foi zerado.
+    ss = st.session_state
+    off = ss.tok_offset
+    if (
+        ss.tok_version != STOPWORDS_VERSION
+        or off > len(entries)
+        or (off and entries[off - 1] != ss.tok_last)
+    ):
+        ss.tok_counter = Counter()
+        ss.tok_version = STOPWORDS_VERSION
+        off = 0
+    ss.tok_counter.update(chain.from_iterable(tokenizar(e.get("text", "")) for e in entries[off:]))
+    ss.tok_offset = len(entries)
+    ss.tok_last = entries[-1] if entries else None
+    return ss.tok_counter
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def build_term_index(version: Tuple[int, int], _respostas: Tuple[str, ...]) -> Dict[str, List[int]]:
+    # termo -> posições das respostas que o contêm; refeito só quando o log muda (somente leitura).
+    idx: Dict[str, List[int]] = defaultdict(list)
+    for i, txt in enumerate(_respostas):
+        for tk in dict.fromkeys(tokenizar(txt)):
+            idx[tk].append(i)
+    return dict(idx)
+
+HISTORY_TAIL = 300  # últimas N respostas exibidas no histórico do admin
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def format_history(version: Tuple[int, int], _tail: List[Dict]) -> List[Dict]:
+    # strftime por linha só roda quando o log muda, não a cada interação do admin.
+    linhas = []
+    for e in _tail:
+        ts = e.get("ts", None)
+        dt = time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(ts)) if ts else ""
+        linhas.append({"data_hora": dt, "resposta": e.get("text", "")})
+    return linhas
+
+# =============================
+# Relatório (ChatGPT) - somente admin
 # =============================
-public_show = load_public_show_cloud()
-entries_all = load_entries()
-respostas_all = [e.get("text", "") for e in entries_all]
+REPORT_MODEL = "gpt-4.1-mini"
+REPORT_CACHE_TTL_S = 3600
+REPORT_TOP_TERMOS = 25  # termos do topo no prompt; também o teto de respostas exemplares citadas
+
+def montar_prompt_relatorio(pergunta: str, respostas: List[str], cont: Counter) -> str:
+    # `cont` é a contagem incremental da sessão: o histórico não é retokenizado aqui.
+    respostas = [r.strip() for r in respostas if r and r.strip()]
+    total = len(respostas)
+
+    top_tokens = cont.most_common(REPORT_TOP_TERMOS)
 
-def compute_tokens_from_respostas(respostas: List[str]) -> List[str]:
-    toks: List[str] = []
+    # Uma resposta exemplar por termo do topo, em vez das 250 primeiras: prompt menor e mais representativo.
+    top_set = {w for w, _ in top_tokens}
+    exemplares: Dict[str, str] = {}
     for r in respostas:
-        toks.extend(tokenizar(r))
-    return toks
+        for t in tokenizar(r):
+            if t in top_set and t not in exemplares:
+                exemplares[t] = r
+                break
+        if len(exemplares) == len(top_set):
+            break
+    if exemplares:
+        sample = list(exemplares.values())  # no máximo uma por termo: <= REPORT_TOP_TERMOS
+        sample_titulo = "Respostas exemplares (uma por termo do topo; amostra, não a lista completa)"
+    else:
+        sample = respostas[:REPORT_TOP_TERMOS]
+        sample_titulo = "Respostas (amostra: as primeiras do histórico)"
+    respostas_bullets = "\n".join(f"- {s}" for s in sample)
+    top_tokens_text = "\n".join([f"- {w}: {c}" for w, c in top_tokens])
+
+    return f"""
+Você é um analista educacional (disciplina: Modelagem de Dados para Tomada de Decisão).
+Gere um relatório em português (tom institucional, claro e objetivo) com base na pergunta e nas respostas coletadas.
+
+Pergunta:
+{pergunta}
+
+Métricas rápidas:
+- Total de respostas: {total}
+
+Top termos (após filtragem de stopwords):
+{top_tokens_text if top_tokens_text else "- (sem termos suficientes)"}
+
+{sample_titulo}:
+{respostas_bullets if respostas_bullets else "- (sem respostas)"}
+
+Regras:
+- Não invente dados que não estejam nas respostas.
+- Se houver ambiguidade/baixa evidência, sinalize como hipótese.
+
+Estrutura do relatório:
+1) Visão geral (2–4 linhas)
+2) Principais temas percebidos (bullet points)
+3) Interpretações e possíveis significados (curto e direto)
+4) Pontos de atenção (viés, ruído, termos ambíguos, respostas muito curtas)
+5) Recomendações práticas para a disciplina (3 a 6 ações)
+6) Síntese final (1 parágrafo)
+"""
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _openai_client(api_key: str):
+    # Um cliente por chave: o pool HTTP (conexão TLS) é reaproveitado entre relatórios.
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key)
+
+def stream_relatorio(api_key: str, prompt: str, fim: Dict):
+    # Repassa os trechos à medida que chegam (st.write_stream), em vez de esperar o texto completo.
+    # O SDK não levanta exceção em response.failed/incomplete (o erro vem dentro de `response`):
+    # o desfecho fica em fim["status"] ("completed", "failed", "incomplete" ou "error") e fim["motivo"].
+    client = _openai_client(api_key)
+    for event in client.responses.create(model=REPORT_MODEL, input=prompt, stream=True):
+        if event.type == "response.output_text.delta":
+            yield event.delta
+        elif event.type == "response.completed":
+            fim["status"] = "completed"
+        elif event.type == "response.failed":
+            erro = getattr(event.response, "error", None)
+            fim["status"], fim["motivo"] = "failed", getattr(erro, "message", "") or ""
+        elif event.type == "response.incomplete":
+            detalhes = getattr(event.response, "incomplete_details", None)
+            fim["status"], fim["motivo"] = "incomplete", getattr(detalhes, "reason", "") or ""
+        elif event.type == "error":
+            fim["status"], fim["motivo"] = "error", getattr(event, "message", "") or ""
+
+class _ReportCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items: Dict[Tuple, Tuple[float, str]] = {}
+
+@st.cache_resource(show_spinner=False)
+def _report_cache() -> _ReportCache:
+    # (pergunta, versão do log, sha256 da chave) -> (ts, texto); compartilhado entre as sessões do processo.
+    return _ReportCache()
+
+def relatorio_cache_key(api_key: str, pergunta: str, version: Tuple[int, int]) -> Tuple:
+    return (pergunta, version, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+
+def relatorio_em_cache(key: Tuple) -> Optional[str]:
+    cache = _report_cache()
+    with cache.lock:
+        hit = cache.items.get(key)
+    if hit and time.time() - hit[0] < REPORT_CACHE_TTL_S:
+        return hit[1]
+    return None
+
+def guardar_relatorio(key: Tuple, texto: str):
+    cache = _report_cache()
+    now = time.time()
+    # Sob lock: outra sessão admin pode estar gravando no mesmo dict durante a varredura.
+    with cache.lock:
+        for k in [k for k, (ts, _) in cache.items.items() if now - ts >= REPORT_CACHE_TTL_S]:
+            del cache.items[k]
+        cache.items[key] = (now, texto)
 
 # =============================
-# UI principal
+# Fragmentos (reexecutam sozinhos, sem rerun da página inteira)
 # =============================
-col1, col2 = st.columns([2, 1], gap="large")
+CLOUD_REFRESH_S = 2  # nuvem e contagem do público se atualizam sozinhas neste intervalo
 
-with col1:
+@st.fragment(run_every=CLOUD_REFRESH_S)
+def question_fragment():
+    # Reexecuta sozinho como a nuvem: sessões públicas não fazem mais rerun completo,
+    # e é assim que a pergunta salva pelo admin chega a elas.
     pergunta = load_question()
 
     st.markdown(
@@ -353,20 +692,9 @@ with col1:
         unsafe_allow_html=True
     )
 
-    st.markdown("**Exemplos de resposta:**")
-    st.markdown(
-        """
-        <span class="chip">qualidade</span>
-        <span class="chip">governança</span>
-        <span class="chip">granularidade</span>
-        <span class="chip">consistência</span>
-        <span class="chip">modelo dimensional</span>
-        <span class="chip">integridade</span>
-        <span class="chip">contexto</span>
-        """,
-        unsafe_allow_html=True
-    )
-
+@st.fragment
+def answer_fragment():
+    # Enviar uma resposta reexecuta só este bloco, não a nuvem nem o painel admin.
     st.markdown("#### 🧑‍🎓 Digite sua resposta e pressione Enter")
     st.text_input(
         "Resposta",
@@ -377,212 +705,216 @@ with col1:
         label_visibility="collapsed",
     )
 
-    st.markdown("#### ☁️ Nuvem de palavras")
-
-    if (not st.session_state.is_admin) and (not public_show):
+@st.fragment(run_every=CLOUD_REFRESH_S)
+def cloud_fragment():
+    if (not st.session_state.is_admin) and (not load_public_show_cloud()):
         st.info("🔒 Coleta em andamento. A nuvem será revelada ao final pelo professor.")
     else:
-        tokens_all = compute_tokens_from_respostas(respostas_all)
-        fig = gerar_wordcloud_fig(tokens_all)
-        if fig is None:
+        cont = update_token_counter(load_entries())
+        # Mudanças fora do top-N não alteram a imagem: a chave ignora a cauda.
+        img = build_cloud(tuple(cont.most_common(CLOUD_MAX_WORDS)))
+        if img is None:
             st.info("Ainda não há termos suficientes. Digite uma resposta e pressione Enter.")
         else:
-            st.pyplot(fig, clear_figure=True)
-
-with col2:
-    if not st.session_state.is_admin:
-        st.subheader("📌 Painel do aluno")
-        st.metric("Respostas enviadas (total)", len(respostas_all))
-        if public_show:
-            st.success("A nuvem foi revelada pelo professor.")
-        else:
-            st.caption("Envie sua resposta agora. A nuvem será exibida ao final da dinâmica.")
-
-        st.divider()
-        st.markdown("**Dica:** responda com algo que ajude decisões melhores com dados.")
-        st.markdown(
-            "- Pode ser **um conceito** (ex.: *governança*)\n"
-            "- Ou **uma etapa** (ex.: *modelagem dimensional*)\n"
-            "- Ou **um problema comum** (ex.: *inconsistência*)"
-        )
+            st.image(img, width="stretch")
+
+@st.fragment(run_every=CLOUD_REFRESH_S)
+def student_panel():
+    public_show = load_public_show_cloud()
+    st.subheader("📌 Painel do aluno")
+    st.metric("Respostas enviadas (total)", len(load_entries()))
+    if public_show:
+        st.success("A nuvem foi revelada pelo professor.")
     else:
-        st.subheader("📊 Resumo (Admin)")
+        st.caption("Envie sua resposta agora. A nuvem será exibida ao final da dinâmica.")
 
-        tokens_all = compute_tokens_from_respostas(respostas_all)
-        cont = Counter(tokens_all)
+    st.divider()
+    st.markdown("**Dica:** responda com algo que ajude decisões melhores com dados.")
+    st.markdown(
+        "- Pode ser **um conceito** (ex.: *governança*)\n"
+        "- Ou **uma etapa** (ex.: *modelagem dimensional*)\n"
+        "- Ou **um problema comum** (ex.: *inconsistência*)"
+    )
 
-        st.metric("Total de respostas", len(respostas_all))
-        st.metric("Total de termos (filtrados)", sum(cont.values()))
-        st.metric("Termos únicos", len(cont))
+@st.fragment
+def admin_panel():
+    flush_entries()  # admin vê também os envios ainda na fila
+    data = load_data()
+    version = entries_version()
+    entries_all = load_entries(version)
+    respostas_all = [e.get("text", "") for e in entries_all]
+    cont = update_token_counter(entries_all)
+
+    st.subheader("📊 Resumo (Admin)")
+
+    st.metric("Total de respostas", len(respostas_all))
+    st.metric("Total de termos (filtrados)", sum(cont.values()))
+    st.metric("Termos únicos", len(cont))
+
+    st.markdown("### 🔝 Top termos (Admin)")
+    top80 = cont.most_common(80)  # uma seleção serve à tabela (top 15) e ao seletor (top 80)
+    top = top80[:15]
+    if top:
+        st.table([{"termo": t, "freq": f} for t, f in top])
+    else:
+        st.caption("Sem dados ainda.")
 
-        st.markdown("### 🔝 Top termos (Admin)")
-        top = cont.most_common(15)
-        if top:
-            st.table([{"termo": t, "freq": f} for t, f in top])
-        else:
-            st.caption("Sem dados ainda.")
-
-        st.divider()
-        st.subheader("🔎 Explorar um termo (Admin)")
-        termos_disponiveis = [t for t, _ in cont.most_common(80)]
-        if termos_disponiveis:
-            termo_sel = st.selectbox("Selecione um termo", termos_disponiveis, index=0)
-            st.write(f"**Frequência:** {cont.get(termo_sel, 0)}")
-
-            exemplos = [txt for txt in respostas_all if termo_sel.lower() in (txt or "").lower()]
-            if exemplos:
-                st.markdown("**Exemplos (até 10):**")
-                for ex in exemplos[:10]:
-                    st.write(f"- {ex}")
-                if len(exemplos) > 10:
-                    st.caption(f"Mostrando 10 de {len(exemplos)} exemplos.")
-            else:
-                st.caption("Nenhum exemplo encontrado.")
+    st.divider()
+    st.subheader("🔎 Explorar um termo (Admin)")
+    termos_disponiveis = [t for t, _ in top80]
+    if termos_disponiveis:
+        termo_sel = st.selectbox("Selecione um termo", termos_disponiveis, index=0)
+        st.write(f"**Frequência:** {cont.get(termo_sel, 0)}")
+
+        idx = build_term_index(version, tuple(respostas_all))
+        exemplos = [respostas_all[i] for i in idx.get(termo_sel, [])]
+        if exemplos:
+            st.markdown("**Exemplos (até 10):**")
+            for ex in exemplos[:10]:
+                st.write(f"- {ex}")
+            if len(exemplos) > 10:
+                st.caption(f"Mostrando 10 de {len(exemplos)} exemplos.")
         else:
-            st.caption("Digite respostas para habilitar a exploração.")
-
-        st.divider()
-        st.subheader("👥 Exibição para o público (Admin)")
-
-        public_show = load_public_show_cloud()
-        st.caption(f"Status atual: público {'VÊ' if public_show else 'NÃO VÊ'} a nuvem.")
-
-        c1, c2 = st.columns(2)
-        with c1:
-            if st.button("🟡 Modo Coleta (ocultar do público)"):
-                set_public_show_cloud(False)
-                st.success("Público NÃO verá a nuvem durante a coleta.")
-                st.rerun()
-
-        with c2:
-            if st.button("🟢 Revelar nuvem ao público"):
-                set_public_show_cloud(True)
-                st.success("Nuvem revelada ao público.")
-                st.rerun()
-
-        st.divider()
-        st.subheader("🛠️ Controles (Admin)")
-
-        st.markdown("#### ✍️ Pergunta exibida aos alunos")
-        if not st.session_state.admin_question_draft:
-            st.session_state.admin_question_draft = load_question()
-
-        st.text_area(
-            "Editar pergunta",
-            key="admin_question_draft",
-            height=110,
-            placeholder="Digite aqui a pergunta que aparecerá para os alunos…",
-        )
+            st.caption("Nenhum exemplo encontrado.")
+    else:
+        st.caption("Digite respostas para habilitar a exploração.")
 
-        b1, b2 = st.columns(2)
-        with b1:
-            if st.button("💾 Salvar pergunta"):
-                set_question(st.session_state.admin_question_draft)
-                st.success("Pergunta atualizada.")
-                st.rerun()
-        with b2:
-            if st.button("↩️ Restaurar padrão"):
-                st.session_state.admin_question_draft = DEFAULT_QUESTION
-                set_question(DEFAULT_QUESTION)
-                st.info("Pergunta restaurada para o padrão.")
-                st.rerun()
-
-        st.markdown("#### 🧾 Histórico (Admin)")
-        modo = st.radio("Visualização", ["Somente respostas (texto)", "Com data/hora"], horizontal=True)
+    st.divider()
+    st.subheader("👥 Exibição para o público (Admin)")
 
-        if modo == "Somente respostas (texto)":
-            st.write(respostas_all[-300:])
-        else:
-            linhas = []
-            for e in entries_all[-300:]:
-                ts = e.get("ts", None)
-                dt = time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(ts)) if ts else ""
-                linhas.append({"data_hora": dt, "resposta": e.get("text", "")})
-            st.dataframe(linhas, use_container_width=True, hide_index=True)
-
-        st.markdown("#### 🧹 Limpeza")
-        if st.button("Zerar nuvem (limpar respostas)"):
-            clear_all_entries()
-            st.success("Respostas apagadas. Nuvem zerada.")
-            st.session_state.relatorio = ""
-            set_public_show_cloud(False)
-            st.rerun()
+    public_show = load_public_show_cloud(data)
+    st.caption(f"Status atual: público {'VÊ' if public_show else 'NÃO VÊ'} a nuvem.")
 
-        st.divider()
-        st.subheader("🧠 Relatório automático (ChatGPT)")
+    c1, c2 = st.columns(2)
+    with c1:
+        # Só o fragmento reroda; a nuvem pública pega o flag no próximo ciclo do cloud_fragment.
+        if st.button("🟡 Modo Coleta (ocultar do público)", on_click=set_public_show_cloud, args=(False,)):
+            st.success("Público NÃO verá a nuvem durante a coleta.")
 
-        if not OPENAI_AVAILABLE:
-            st.warning("O pacote 'openai' não está instalado. Inclua 'openai' no requirements.txt.")
-        else:
-            st.text_input(
-                "OPENAI_API_KEY (digite na hora — não será salva no GitHub)",
-                key="admin_api_key",
-                type="password",
-                placeholder="sk-...",
-            )
+    with c2:
+        if st.button("🟢 Revelar nuvem ao público", on_click=set_public_show_cloud, args=(True,)):
+            st.success("Nuvem revelada ao público.")
 
-            def gerar_relatorio_chatgpt(api_key: str, pergunta: str, respostas: List[str]) -> str:
-                api_key = (api_key or "").strip()
-                if not api_key:
-                    return "⚠️ Informe a OPENAI_API_KEY no campo acima."
+    st.divider()
+    st.subheader("🛠️ Controles (Admin)")
 
-                client = OpenAI(api_key=api_key)
+    st.markdown("#### ✍️ Pergunta exibida aos alunos")
+    if not st.session_state.admin_question_draft:
+        st.session_state.admin_question_draft = load_question(data)
 
-                respostas = [r.strip() for r in respostas if r and r.strip()]
-                total = len(respostas)
+    st.text_area(
+        "Editar pergunta",
+        key="admin_question_draft",
+        height=110,
+        placeholder="Digite aqui a pergunta que aparecerá para os alunos…",
+    )
 
-                all_tokens2 = []
-                for r in respostas:
-                    all_tokens2.extend(tokenizar(r))
-                top_tokens = Counter(all_tokens2).most_common(25)
+    b1, b2 = st.columns(2)
+    with b1:
+        # A pergunta aparece fora do fragmento (col1): aqui o rerun completo continua necessário.
+        if st.button("💾 Salvar pergunta"):
+            set_question(st.session_state.admin_question_draft)
+            st.rerun()
+    with b2:
+        if st.button("↩️ Restaurar padrão", on_click=on_restore_question):
+            st.rerun()
 
-                sample = respostas[:250]
-                respostas_bullets = "\n".join(f"- {s}" for s in sample)
-                top_tokens_text = "\n".join([f"- {w}: {c}" for w, c in top_tokens])
+    with st.expander("🧾 Histórico (Admin)", expanded=False):
+        modo = st.radio("Visualização", ["Somente respostas (texto)", "Com data/hora"], horizontal=True)
 
-                prompt = f"""
-Você é um analista educacional (disciplina: Modelagem de Dados para Tomada de Decisão).
-Gere um relatório em português (tom institucional, claro e objetivo) com base na pergunta e nas respostas coletadas.
+        if modo == "Somente respostas (texto)":
+            st.write(respostas_all[-HISTORY_TAIL:])
+        else:
+            st.dataframe(format_history(version, entries_all[-HISTORY_TAIL:]), width="stretch", hide_index=True)
 
-Pergunta:
-{pergunta}
+    st.markdown("#### 🧹 Limpeza")
+    if st.button("Zerar nuvem (limpar respostas)"):
+        clear_all_entries()
+        tokenizar.cache_clear()
+        st.success("Respostas apagadas. Nuvem zerada.")
+        st.session_state.relatorio = ""
+        set_public_show_cloud(False)
+        st.rerun()
 
-Métricas rápidas:
-- Total de respostas: {total}
+    st.divider()
+    st.subheader("🧠 Relatório automático (ChatGPT)")
 
-Top termos (após filtragem de stopwords):
-{top_tokens_text if top_tokens_text else "- (sem termos suficientes)"}
+    if not OPENAI_AVAILABLE:
+        st.warning("O pacote 'openai' não está instalado. Inclua 'openai' no requirements.txt.")
+    else:
+        st.text_input(
+            "OPENAI_API_KEY (digite na hora — não será salva no GitHub)",
+            key="admin_api_key",
+            type="password",
+            placeholder="sk-...",
+        )
 
-Respostas (amostra/lista):
-{respostas_bullets if respostas_bullets else "- (sem respostas)"}
+        st.caption(
+            "O relatório usa a pergunta atual, o total e os termos mais frequentes de TODO o histórico "
+            "e uma resposta exemplar por termo do topo."
+        )
 
-Regras:
-- Não invente dados que não estejam nas respostas.
-- Se houver ambiguidade/baixa evidência, sinalize como hipótese.
+        if st.button("📄 Gerar relatório"):
+            api_key = (st.session_state.admin_api_key or "").strip()
+            if not api_key:
+                st.session_state.relatorio = "⚠️ Informe a OPENAI_API_KEY no campo acima."
+            else:
+                pergunta = load_question(data)
+                key = relatorio_cache_key(api_key, pergunta, version)
+                texto = relatorio_em_cache(key)
+                if texto is None:
+                    # Mostra o texto chegando; ao final, a caixa "Relatório" abaixo assume.
+                    ao_vivo = st.empty()
+                    fim: Dict = {}
+                    with ao_vivo:
+                        texto = st.write_stream(
+                            stream_relatorio(api_key, montar_prompt_relatorio(pergunta, respostas_all, cont), fim)
+                        ) or ""
+                    ao_vivo.empty()
+                    if fim.get("status") == "completed" and texto:
+                        # Só relatórios concluídos vão para o cache; falhas podem ser refeitas no próximo clique.
+                        guardar_relatorio(key, texto)
+                    else:
+                        motivo = fim.get("motivo") or fim.get("status") or "resposta interrompida"
+                        st.error(f"Relatório não concluído ({motivo}). Clique em \"Gerar relatório\" para tentar de novo.")
+                        texto = texto or "(sem texto retornado)"
+                st.session_state.relatorio = texto
+
+        if st.session_state.relatorio:
+            st.text_area("Relatório", st.session_state.relatorio, height=360)
 
-Estrutura do relatório:
-1) Visão geral (2–4 linhas)
-2) Principais temas percebidos (bullet points)
-3) Interpretações e possíveis significados (curto e direto)
-4) Pontos de atenção (viés, ruído, termos ambíguos, respostas muito curtas)
-5) Recomendações práticas para a disciplina (3 a 6 ações)
-6) Síntese final (1 parágrafo)
-"""
-                resp = client.responses.create(model="gpt-4.1-mini", input=prompt)
-                return getattr(resp, "output_text", "") or "(sem texto retornado)"
+# =============================
+# UI principal
+# =============================
+col1, col2 = st.columns([2, 1], gap="large")
 
-            st.caption("O relatório usa a pergunta atual + TODAS as respostas do histórico.")
+with col1:
+    question_fragment()
+
+    st.markdown("**Exemplos de resposta:**")
+    st.markdown(
+        """
+        <span class="chip">qualidade</span>
+        <span class="chip">governança</span>
+        <span class="chip">granularidade</span>
+        <span class="chip">consistência</span>
+        <span class="chip">modelo dimensional</span>
+        <span class="chip">integridade</span>
+        <span class="chip">contexto</span>
+        """,
+        unsafe_allow_html=True
+    )
 
-            if st.button("📄 Gerar relatório"):
-                with st.spinner("Gerando relatório..."):
-                    st.session_state.relatorio = gerar_relatorio_chatgpt(
-                        api_key=st.session_state.admin_api_key,
-                        pergunta=load_question(),
-                        respostas=respostas_all,
-                    )
+    answer_fragment()
 
-            if st.session_state.relatorio:
-                st.text_area("Relatório", st.session_state.relatorio, height=360)
+    st.markdown("#### ☁️ Nuvem de palavras")
+    cloud_fragment()
+
+with col2:
+    if not st.session_state.is_admin:
+        student_panel()
+    else:
+        admin_panel()
 
 # =============================
 # Rodapé